@@ -1,20 +1,116 @@
 import streamlit as st
 import re
-from groq import Groq
-from youtube_comment_downloader import YoutubeCommentDownloader
-import pandas as pd
+import asyncio
+import hashlib
+import io
+import threading
+import time
+from pathlib import Path
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
+_VIDEO_ID_RE = re.compile(r"v=([^&]+)")
+_YOUTU_BE_RE = re.compile(r"youtu\.be/([^?&/]+)")
+_WORD_RE = re.compile(r"\w+")
+
+MAX_URL_LENGTH = 2048
+
+CSS_PATH = Path(__file__).parent / "static" / "app.css"
+
+# (needle, message) pairs matched against lower-cased exception text, first hit wins
+_FETCH_ERRORS = (
+    ("video unavailable", "Video not found or is private/unavailable."),
+    ("comments are disabled", "Comments are disabled for this video."),
+)
+_GROQ_ERRORS = (
+    ("authentication", "Invalid API key. Check your Groq API credentials."),
+    ("api key", "Invalid API key. Check your Groq API credentials."),
+    ("rate limit", "Rate limit exceeded. Wait a moment and try again."),
+    ("model", "Model '{model_name}' not found or not accessible."),
+)
+
+COMMENT_MAX_CHARS = 200
+
+# Batches larger than this are summarized per chunk in parallel, then reduced
+MAP_CHUNK_SIZE = 50
+MAP_MAX_TOKENS = 800
+
+# With smart skip on, fewer distinct comments than this never reach Groq
+MIN_DISTINCT_COMMENTS = 3
+
+SUMMARY_CACHE_TTL = 86400
+SUMMARY_CACHE_MAX_ENTRIES = 256
+
+PROMPT_TEMPLATE = """You are a professional content analyst. Analyze these YouTube comments and provide:
+
+1. **Main Themes** - Key topics discussed (3-5 bullet points)
+2. **Sentiment Breakdown** - Overall tone (positive/negative/mixed) with percentages
+3. **Notable Insights** - Interesting or recurring observations
+4. **Top Concerns/Praise** - What viewers loved or complained about most
+{instructions}
+
+Comments to analyze:
+{body}
+"""
+
+REDUCE_PROMPT_TEMPLATE = """You are a professional content analyst. Below are partial analyses, each covering a separate batch of comments on the same YouTube video. Merge them into one analysis that provides:
+
+1. **Main Themes** - Key topics discussed (3-5 bullet points)
+2. **Sentiment Breakdown** - Overall tone (positive/negative/mixed) with percentages, averaged across batches
+3. **Notable Insights** - Interesting or recurring observations
+4. **Top Concerns/Praise** - What viewers loved or complained about most
+{instructions}
+
+Partial analyses:
+{body}
+"""
+
+@st.cache_data(show_spinner=False)
+def load_css():
+    """Read the app stylesheet once per process."""
+    return CSS_PATH.read_text(encoding="utf-8")
 
 def get_video_id(url):
     """Extract YouTube video ID from URL."""
-    if not url:
+    if not url or len(url) > MAX_URL_LENGTH:
         return None
-    if "youtu.be" in url:
-        return url.split("/")[-1].split("?")[0]
-    else:
-        match = re.search(r"v=([^&]+)", url)
-        if match:
-            return match.group(1)
-    return None
+    try:
+        parsed = urlparse(url)
+        if parsed.netloc.endswith("youtu.be"):
+            video_id = parsed.path.lstrip("/").split("/")[0]
+        else:
+            video_id = parse_qs(parsed.query).get("v", [None])[0]
+    except ValueError:
+        # urlparse rejects e.g. stray brackets ("Invalid IPv6 URL")
+        video_id = None
+    if video_id:
+        return video_id
+    # Fall back to regex for malformed inputs (e.g. missing scheme)
+    match = _YOUTU_BE_RE.search(url) or _VIDEO_ID_RE.search(url)
+    return match.group(1) if match else None
+
+@st.cache_resource
+def _fetch_executor():
+    """Process-wide worker pool for network-bound comment fetches."""
+    return ThreadPoolExecutor(max_workers=4)
+
+@st.cache_resource
+def _prefetch_executor():
+    """Single background worker for speculative fetches, kept off the main pool."""
+    return ThreadPoolExecutor(max_workers=1)
+
+@st.cache_data(ttl=3600, max_entries=128, show_spinner=False)
+def _download_comments(video_id, max_comments, sort_by):
+    """
+    Download up to max_comments full comment texts.
+    Results are cached per (video_id, max_comments, sort_by) for an hour.
+    Exceptions propagate and are never cached.
+    """
+    # One downloader per fetch: its requests.Session isn't safe to share across threads
+    from youtube_comment_downloader import YoutubeCommentDownloader
+    comments_gen = YoutubeCommentDownloader().get_comments(video_id, sort_by=sort_by)
+    return [comment['text'] for comment in islice(comments_gen, max_comments)]
 
 def fetch_comments(video_id, max_comments=50, sort_by=0):
     """
@@ -22,75 +118,232 @@ def fetch_comments(video_id, max_comments=50, sort_by=0):
     sort_by: 0 = popular, 1 = newest
     Returns: (comments_list, error_message)
     """
-    downloader = YoutubeCommentDownloader()
-    comments_list = []
-    
     try:
-        comments_gen = downloader.get_comments(video_id, sort_by=sort_by)
-        for comment in comments_gen:
-            comments_list.append(comment['text'])
-            if len(comments_list) >= max_comments:
-                break
-                
-        if not comments_list:
-            return [], "No comments found. The video might have comments disabled or be private."
-            
-        return comments_list, None
-        
+        comments_list = _download_comments(video_id, max_comments, sort_by)
     except Exception as e:
         error_msg = str(e)
-        if "Video unavailable" in error_msg:
-            return [], "Video not found or is private/unavailable."
-        elif "comments are disabled" in error_msg.lower():
-            return [], "Comments are disabled for this video."
-        else:
-            return [], f"Error fetching comments: {error_msg}"
+        low = error_msg.lower()
+        for needle, message in _FETCH_ERRORS:
+            if needle in low:
+                return [], message
+        return [], f"Error fetching comments: {error_msg}"
+
+    if not comments_list:
+        return [], "No comments found. The video might have comments disabled or be private."
+
+    return comments_list, None
+
+def _simhash(text):
+    """64-bit simhash over word 3-shingles, or None if text has no words."""
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return None
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))]
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+def dedupe_comments(comments, max_distance=3):
+    """
+    Drop exact and near-duplicate comments, keeping first occurrences.
+    Near-duplicates are comments whose simhash is within max_distance bits
+    of one already kept. Comments without words (emoji, punctuation) are
+    only matched exactly.
+    """
+    seen = set()
+    kept_hashes = []
+    unique = []
+    for comment in comments:
+        normalized = comment.strip().lower()
+        if normalized in seen:
+            continue
+        seen.add(normalized)
+        fingerprint = _simhash(normalized)
+        if fingerprint is None:
+            unique.append(comment)
+            continue
+        if any(bin(fingerprint ^ other).count("1") <= max_distance for other in kept_hashes):
+            continue
+        kept_hashes.append(fingerprint)
+        unique.append(comment)
+    return unique
+
+def _load_token_encoding():
+    """Load the cl100k_base BPE encoding; first use downloads it, which can fail offline."""
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
+
+@st.cache_resource
+def _token_encoding_state():
+    """Process-wide handle on the background encoding load."""
+    return {"future": None}, threading.Lock()
+
+def _token_encoding():
+    """
+    Return the tiktoken encoding, or None while it loads in the background.
+    Failed loads (tiktoken missing, download error) are retried on the next call.
+    """
+    state, lock = _token_encoding_state()
+    with lock:
+        future = state["future"]
+        if future is None or (future.done() and future.exception() is not None):
+            future = state["future"] = _prefetch_executor().submit(_load_token_encoding)
+    return future.result() if future.done() and future.exception() is None else None
 
 def estimate_tokens(text):
-    """Rough token estimation (4 chars ≈ 1 token)."""
-    return len(text) // 4
+    """Token estimation via tiktoken, falling back to 4 chars ≈ 1 token until it loads."""
+    encoding = _token_encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def summary_cache_key(model_name, comments, instructions=""):
+    """Content hash identifying a summarization request."""
+    payload = b"\0".join([
+        model_name.encode(),
+        instructions.encode(),
+        "\n".join(comments).encode(),
+    ])
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+@st.cache_resource
+def _groq_client(api_key):
+    """Groq client per API key, reused so its HTTP connection pool stays warm."""
+    from groq import Groq
+    return Groq(api_key=api_key)
+
+@st.cache_resource
+def _summary_cache():
+    """
+    Process-wide {cache_key: (created_at, summary)} store for finished summaries.
+    Streamed responses can't go through st.cache_data, so entries are written
+    once a stream completes.
+    """
+    return {}, threading.Lock()
+
+def _get_cached_summary(cache_key):
+    """Return a cached summary younger than SUMMARY_CACHE_TTL, else None."""
+    cache, lock = _summary_cache()
+    with lock:
+        entry = cache.get(cache_key)
+    if entry and time.monotonic() - entry[0] < SUMMARY_CACHE_TTL:
+        return entry[1]
+    return None
+
+def _store_summary(cache_key, summary):
+    """Cache a finished summary, evicting the oldest entry when full."""
+    cache, lock = _summary_cache()
+    with lock:
+        cache.pop(cache_key, None)
+        if len(cache) >= SUMMARY_CACHE_MAX_ENTRIES:
+            cache.pop(next(iter(cache)))
+        cache[cache_key] = (time.monotonic(), summary)
+
+def _stream_completion(response, cache_key):
+    """Yield text deltas from a streamed completion, caching the full text at the end."""
+    parts = []
+    for chunk in response:
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+    if parts:
+        _store_summary(cache_key, "".join(parts))
+
+def _build_prompt(comments, instruction_text):
+    """Fill PROMPT_TEMPLATE with a bulleted list of comments."""
+    body = "\n".join(["- " + c for c in comments])
+    return PROMPT_TEMPLATE.format(instructions=instruction_text, body=body)
+
+async def _summarize_chunks(groq_api_key, model_name, prompts):
+    """
+    Run the map step: one concurrent Groq completion per prompt.
+    All chunks are awaited, then the first failure is raised. A partial set of
+    analyses would skew the reduced summary, so there is no partial result.
+    """
+    from groq import AsyncGroq
+    async with AsyncGroq(api_key=groq_api_key) as client:
+        results = await asyncio.gather(*[
+            client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=model_name,
+                temperature=0.5,
+                max_tokens=MAP_MAX_TOKENS,
+            )
+            for prompt in prompts
+        ], return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    partials = [result.choices[0].message.content for result in results]
+    if not all(partials):
+        raise RuntimeError("Groq returned an empty analysis for part of the comments.")
+    return partials
+
+def groq_error_message(error, model_name):
+    """Map a Groq API exception to a user-facing message."""
+    error_msg = str(error)
+    low = error_msg.lower()
+    for needle, message in _GROQ_ERRORS:
+        if needle in low:
+            return message.format(model_name=model_name)
+    return f"API Error: {error_msg}"
+
+def count_api_calls(num_comments):
+    """Number of Groq calls needed to summarize num_comments comments."""
+    if num_comments <= MAP_CHUNK_SIZE:
+        return 1
+    return -(-num_comments // MAP_CHUNK_SIZE) + 1
 
 def summarize_comments_with_groq(groq_api_key, model_name, comments, instructions=""):
-    """Send comments to Groq API for summarization."""
+    """
+    Send comments to Groq API for summarization.
+    More than MAP_CHUNK_SIZE comments are split into chunks summarized in
+    parallel, and only the final reduce call is streamed.
+    Returns: (summary_stream, error_message), where summary_stream is an
+    iterable of text chunks suitable for st.write_stream. Errors raised while
+    consuming the stream should be mapped with groq_error_message.
+    """
     if not comments:
         return None, "No comments to summarize."
 
-    client = Groq(api_key=groq_api_key)
-    
     # Build prompt
     instruction_text = f"\n\nAdditional Instructions: {instructions}" if instructions else ""
-    
-    prompt = f"""You are a professional content analyst. Analyze these YouTube comments and provide:
 
-1. **Main Themes** - Key topics discussed (3-5 bullet points)
-2. **Sentiment Breakdown** - Overall tone (positive/negative/mixed) with percentages
-3. **Notable Insights** - Interesting or recurring observations
-4. **Top Concerns/Praise** - What viewers loved or complained about most
-{instruction_text}
-
-Comments to analyze:
-{chr(10).join(f"- {comment[:200]}" for comment in comments)}
-"""
+    cache_key = summary_cache_key(model_name, comments, instructions)
+    cached = _get_cached_summary(cache_key)
+    if cached is not None:
+        return iter([cached]), None
 
     try:
-        chat_completion = client.chat.completions.create(
+        if len(comments) > MAP_CHUNK_SIZE:
+            chunks = [comments[i:i + MAP_CHUNK_SIZE] for i in range(0, len(comments), MAP_CHUNK_SIZE)]
+            partials = asyncio.run(_summarize_chunks(
+                groq_api_key,
+                model_name,
+                [_build_prompt(chunk, instruction_text) for chunk in chunks],
+            ))
+            prompt = REDUCE_PROMPT_TEMPLATE.format(
+                instructions=instruction_text,
+                body="\n\n---\n\n".join(partials),
+            )
+        else:
+            prompt = _build_prompt(comments, instruction_text)
+
+        response = _groq_client(groq_api_key).chat.completions.create(
             messages=[{"role": "user", "content": prompt}],
             model=model_name,
             temperature=0.5,
             max_tokens=1500,
+            stream=True,
         )
-        return chat_completion.choices[0].message.content, None
+        return _stream_completion(response, cache_key), None
         
     except Exception as e:
-        error_msg = str(e)
-        if "authentication" in error_msg.lower() or "api key" in error_msg.lower():
-            return None, "Invalid API key. Check your Groq API credentials."
-        elif "rate limit" in error_msg.lower():
-            return None, "Rate limit exceeded. Wait a moment and try again."
-        elif "model" in error_msg.lower():
-            return None, f"Model '{model_name}' not found or not accessible."
-        else:
-            return None, f"API Error: {error_msg}"
+        return None, groq_error_message(e, model_name)
 
 # --- Streamlit App ---
 
@@ -101,32 +354,7 @@ st.set_page_config(
 )
 
 # Custom CSS
-st.markdown("""
-    <style>
-    .main-header {
-        font-size: 3rem;
-        font-weight: 700;
-        margin-bottom: 0.5rem;
-        background: linear-gradient(90deg, #FF0000, #CC0000);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-    }
-    .subtitle {
-        color: #666;
-        font-size: 1.1rem;
-        margin-bottom: 2rem;
-    }
-    .stButton>button {
-        font-weight: 600;
-    }
-    .metric-card {
-        background: #f8f9fa;
-        padding: 1rem;
-        border-radius: 0.5rem;
-        border-left: 4px solid #FF0000;
-    }
-    </style>
-""", unsafe_allow_html=True)
+st.markdown(f"<style>{load_css()}</style>", unsafe_allow_html=True)
 
 st.markdown('<p class="main-header">📺 YouTube Comment Analyzer</p>', unsafe_allow_html=True)
 st.markdown('<p class="subtitle">Get AI-powered insights from video comments in seconds</p>', unsafe_allow_html=True)
@@ -136,9 +364,13 @@ if 'summary' not in st.session_state:
     st.session_state.summary = None
 if 'comments' not in st.session_state:
     st.session_state.comments = None
+if 'full_comments' not in st.session_state:
+    st.session_state.full_comments = None
 if 'video_id' not in st.session_state:
     st.session_state.video_id = None
 
+summary_stream = None
+
 # Sidebar for settings
 with st.sidebar:
     st.header("⚙️ Configuration")
@@ -178,6 +410,12 @@ with st.sidebar:
         height=100
     )
     
+    smart_skip = st.toggle(
+        "Smart Skip",
+        value=True,
+        help=f"Skip the AI call when fewer than {MIN_DISTINCT_COMMENTS} distinct comments remain after removing duplicates"
+    )
+    
     st.divider()
     st.caption("💡 Tip: Start with 50 popular comments for best results")
 
@@ -209,62 +447,122 @@ if analyze_button:
     if not video_id:
         st.error("❌ Invalid YouTube URL. Make sure it's in the format: youtube.com/watch?v=... or youtu.be/...")
     else:
-        # Fetch comments
-        with st.spinner("📥 Fetching comments..."):
-            sort_by = 1 if sort_order == "Newest" else 0
-            comments, error = fetch_comments(video_id, max_comments, sort_by)
+        # Start loading the tokenizer off the script thread while comments download
+        _token_encoding()
+        
+        # Fetch comments off the script thread while the status box renders.
+        # The other sort order is prefetched alongside so toggling it is a cache hit.
+        sort_by = 1 if sort_order == "Newest" else 0
+        future = _fetch_executor().submit(fetch_comments, video_id, max_comments, sort_by)
+        _prefetch_executor().submit(fetch_comments, video_id, max_comments, 1 - sort_by)
+        with st.status("📥 Fetching comments...") as status:
+            comments, error = future.result()
+            status.update(
+                label="📥 Comments fetched" if not error else "📥 Fetch failed",
+                state="error" if error else "complete",
+            )
         
         if error:
             st.error(f"❌ {error}")
         elif comments:
+            # Full texts go into the raw view and report; the prompt uses the short form
+            st.session_state.full_comments = comments
+            comments = [c[:COMMENT_MAX_CHARS] for c in comments]
             st.session_state.comments = comments
             st.session_state.video_id = video_id
+            unique_comments = dedupe_comments(comments)
+            st.sidebar.caption(
+                f"🧹 Sending {len(unique_comments)} of {len(comments)} comments after removing duplicates"
+            )
             
             # Show stats
             col1, col2, col3 = st.columns(3)
             with col1:
                 st.metric("Comments Fetched", len(comments))
             with col2:
-                estimated = estimate_tokens(" ".join(comments))
-                st.metric("Est. Tokens", f"~{estimated:,}")
+                api_calls = count_api_calls(len(unique_comments))
+                estimated = estimate_tokens(" ".join(unique_comments))
+                # Map-reduce also feeds every partial analysis into the reduce call
+                estimated += (api_calls - 1) * MAP_MAX_TOKENS
+                st.metric(
+                    "Est. Tokens",
+                    f"~{estimated:,}",
+                    help=f"{api_calls} API call{'s' if api_calls > 1 else ''}"
+                )
             with col3:
                 st.metric("Est. Cost", f"~${estimated * 0.00001:.4f}")
             
-            # Confirm and summarize
-            st.info("⚡ Ready to analyze. This will use your Groq API credits.")
-            
-            with st.spinner("🤖 AI is analyzing comments..."):
-                summary, error = summarize_comments_with_groq(
-                    groq_api_key, 
-                    model_name, 
-                    comments,
-                    instructions
-                )
-            
-            if error:
-                st.error(f"❌ {error}")
+            # Nothing worth a paid API call: show what was fetched instead
+            if smart_skip and len(unique_comments) < MIN_DISTINCT_COMMENTS:
+                st.session_state.summary = None
+                st.warning("⚠️ Too few distinct comments to summarize; showing raw list.")
+                st.dataframe({"Comment": unique_comments}, use_container_width=True, hide_index=True)
             else:
-                st.session_state.summary = summary
+                # Confirm and summarize
+                st.info("⚡ Ready to analyze. This will use your Groq API credits.")
+                
+                with st.spinner("🤖 AI is analyzing comments..."):
+                    stream, error = summarize_comments_with_groq(
+                        groq_api_key, 
+                        model_name, 
+                        unique_comments,
+                        instructions
+                    )
+                
+                if error:
+                    st.error(f"❌ {error}")
+                else:
+                    summary_stream = stream
 
-# Display results
-if st.session_state.summary:
-    st.success("✅ Analysis complete!")
+# Stream a fresh summary, or redisplay the last one
+if summary_stream is not None or st.session_state.summary:
+    status_placeholder = st.empty()
     
     st.markdown("---")
     st.subheader("📊 Comment Analysis")
-    st.markdown(st.session_state.summary)
+    if summary_stream is not None:
+        try:
+            summary = st.write_stream(summary_stream)
+        except Exception as e:
+            summary = None
+            status_placeholder.error(f"❌ {groq_error_message(e, model_name)}")
+        else:
+            if not summary:
+                status_placeholder.error(
+                    f"❌ Model '{model_name}' returned an empty summary. Try again or pick another model."
+                )
+        st.session_state.summary = summary or None
+    else:
+        st.markdown(st.session_state.summary)
+
+# Display results
+if st.session_state.summary:
+    status_placeholder.success("✅ Analysis complete!")
     
     # Show raw comments in expander
-    with st.expander(f"📝 View Raw Comments ({len(st.session_state.comments)} total)", expanded=False):
-        for i, comment in enumerate(st.session_state.comments, 1):
-            st.text(f"{i}. {comment[:300]}{'...' if len(comment) > 300 else ''}")
+    with st.expander(f"📝 View Raw Comments ({len(st.session_state.full_comments)} total)", expanded=False):
+        st.dataframe(
+            {
+                "#": list(range(1, len(st.session_state.full_comments) + 1)),
+                "Comment": st.session_state.full_comments,
+            },
+            use_container_width=True,
+            hide_index=True,
+        )
     
     # Download option
     st.markdown("---")
     col1, col2 = st.columns(2)
     with col1:
-        summary_download = f"# YouTube Comment Analysis\n\n{st.session_state.summary}\n\n---\n\n## Raw Comments\n\n"
-        summary_download += "\n\n".join(f"{i}. {c}" for i, c in enumerate(st.session_state.comments, 1))
+        buf = io.StringIO()
+        buf.write("# YouTube Comment Analysis\n\n")
+        buf.write(st.session_state.summary)
+        buf.write("\n\n---\n\n## Raw Comments\n\n")
+        buf.writelines(
+            f"{i}. {c}" if i == 1 else f"\n\n{i}. {c}"
+            for i, c in enumerate(st.session_state.full_comments, 1)
+        )
+        summary_download = buf.getvalue()
         
         st.download_button(
             "⬇️ Download Full Report",
@@ -277,6 +575,7 @@ if st.session_state.summary:
         if st.button("🔄 Analyze Another Video"):
             st.session_state.summary = None
             st.session_state.comments = None
+            st.session_state.full_comments = None
             st.session_state.video_id = None
             st.rerun()
 